@@ -6,8 +6,10 @@ import os
 import tempfile
 from openai import OpenAI
 import hashlib
+import json
 import base64
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -16,10 +18,53 @@ os.environ["STREAMLIT_DISABLE_WATCHDOG_WARNING"] = "true"
 
 from pydub import AudioSegment
 
+from audio_processing import (
+    CLIP_SETTINGS,
+    CHANNEL_LAYOUTS,
+    DEFAULT_SAMPLE_RATE,
+    OUTPUT_FORMATS,
+    audio_to_wav_bytes,
+    encode_segment,
+    join_segments,
+    segment_schedule,
+    trim_and_normalize,
+    wav_bytes_to_audio
+)
+from shared_cache import SharedCache
+
 st.set_page_config(page_title="Superlearning Audio Generator", page_icon="🎧", layout="wide")
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Translations, clips and decks are shared by all sessions and replicas
+# that see the same SHARED_CACHE_DIR
+@st.cache_resource
+def get_shared_cache():
+    """Process-wide shared cache instance"""
+    return SharedCache()
+
+shared_cache = get_shared_cache()
+
+TRANSLATION_MODEL = "gpt-4o-mini"
+
+# How long to wait for a deck another session or replica is rendering
+# before rendering it here as well
+DECK_WAIT_S = 30
+
+# Nothing is playing before the first segment, so rendering pauses up to
+# this long for it to finish encoding
+FIRST_SEGMENT_WAIT_S = 10
+
+# Segments are encoded while the next pairs are rendered, on one pool shared
+# by all sessions of this process so concurrent decks cannot start an
+# unbounded number of ffmpeg processes
+ENCODE_WORKERS = min(4, os.cpu_count() or 2)
+
+@st.cache_resource
+def get_encode_executor():
+    """Process-wide thread pool for segment encoding"""
+    return ThreadPoolExecutor(max_workers=ENCODE_WORKERS)
+
 # Authentication
 def check_authentication():
     """Check if user is authenticated"""
@@ -118,6 +163,12 @@ TRANSLATIONS = {
         "timing": "⏸️ Časování",
         "pause_label": "Pauza mezi dvojicemi (ms)",
         "pause_help": "Délka ticha mezi jazykovými dvojicemi",
+        "output": "💾 Výstup",
+        "output_format_label": "Formát souboru",
+        "output_format_help": "Opus a AAC při nízkém datovém toku dávají pro mluvené slovo mnohem menší soubory než MP3",
+        "bitrate_label": "Datový tok",
+        "sample_rate_label": "Vzorkovací frekvence (Hz)",
+        "channels_label": "Kanály",
         "tip": "💡 Tip: Upravte nastavení před generováním audia",
         "file_format": "📄 Formát souboru",
         "pairs_format": "**Jazykové dvojice** (použijte `|` nebo `;`):",
@@ -137,8 +188,10 @@ TRANSLATIONS = {
         "generating": "Generování nahrávky...",
         "translating_progress": "Překlad {}/{}: {}...",
         "generating_progress": "Generování nahrávky {}/{}: {}...",
+        "segment_ready": "▶️ Část {}",
+        "deck_rendering_elsewhere": "⏳ Tato nahrávka se právě generuje v jiné relaci, čekám na ni...",
         "success": "🎉 Nahrávka úspěšně vygenerována!",
-        "download_button": "⬇️ Stáhnout MP3",
+        "download_button": "⬇️ Stáhnout {}",
         "download_text_button": "📄 Stáhnout textový soubor",
         "error_empty": "Soubor je prázdný",
         "error_multiple_delimiters": "Chyba: Nalezeno více oddělovačů (| a ;) na stejném řádku. Použijte prosím pouze jeden typ oddělovače.",
@@ -167,6 +220,12 @@ TRANSLATIONS = {
         "timing": "⏸️ Timing",
         "pause_label": "Pause between pairs (ms)",
         "pause_help": "Duration of silence between language pairs",
+        "output": "💾 Output",
+        "output_format_label": "File format",
+        "output_format_help": "Low-bitrate Opus and AAC give much smaller files than MP3 for spoken word",
+        "bitrate_label": "Bitrate",
+        "sample_rate_label": "Sample rate (Hz)",
+        "channels_label": "Channels",
         "tip": "💡 Tip: Adjust settings before generating audio",
         "file_format": "📄 File Format",
         "pairs_format": "**Language pairs** (use `|` or `;`):",
@@ -186,8 +245,10 @@ TRANSLATIONS = {
         "generating": "Generating audio file...",
         "translating_progress": "Translating {}/{}: {}...",
         "generating_progress": "Generating audio {}/{}: {}...",
+        "segment_ready": "▶️ Part {}",
+        "deck_rendering_elsewhere": "⏳ This recording is being generated in another session, waiting for it...",
         "success": "🎉 Audio generated successfully!",
-        "download_button": "⬇️ Download MP3",
+        "download_button": "⬇️ Download {}",
         "download_text_button": "📄 Download text file",
         "error_empty": "File is empty",
         "error_multiple_delimiters": "Error: Multiple delimiters (| and ;) found on the same line. Please use only one delimiter type.",
@@ -282,6 +343,36 @@ with st.sidebar:
         help=t("pause_help")
     )
     
+    st.markdown("---")
+    st.subheader(t("output"))
+    
+    output_format = st.selectbox(
+        t("output_format_label"),
+        options=list(OUTPUT_FORMATS.keys()),
+        format_func=lambda x: x.upper(),
+        help=t("output_format_help")
+    )
+    
+    # Only rates and bitrates the selected encoder can honor are offered
+    format_rates = OUTPUT_FORMATS[output_format]["sample_rates"]
+    sample_rate = st.selectbox(
+        t("sample_rate_label"),
+        options=list(format_rates.keys()),
+        index=list(format_rates.keys()).index(DEFAULT_SAMPLE_RATE)
+    )
+    
+    bitrate = st.select_slider(
+        t("bitrate_label"),
+        options=format_rates[sample_rate],
+        value=OUTPUT_FORMATS[output_format]["default_bitrate"]
+    )
+    
+    channel_layout = st.radio(
+        t("channels_label"),
+        options=list(CHANNEL_LAYOUTS.keys()),
+        horizontal=True
+    )
+    
     st.markdown("---")
     st.caption(t("tip"))
 
@@ -308,17 +399,28 @@ def translate_text(texts, source_lang, target_lang):
     progress_bar = st.progress(0)
     status_text = st.empty()
     
+    system_prompt = f"Translate the following {source_lang} text to {target_lang}. Return only the translation."
+
+    def request_translation(text):
+        resp = client.chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": text}
+            ],
+        )
+        return (resp.choices[0].message.content or "").strip().encode("utf-8")
+
     for i, text in enumerate(texts):
         status_text.text(t("translating_progress", i+1, len(texts), text[:50]))
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": f"Translate the following {source_lang} text to {target_lang}. Return only the translation."},
-                    {"role": "user", "content": text}
-                ],
-            )
-            translation = (resp.choices[0].message.content or "").strip()
+            # Failed requests raise, so errors are never cached. Keyed on the
+            # model and prompt so changing either does not serve stale translations
+            translation = shared_cache.get_or_create(
+                "translations",
+                f"{TRANSLATION_MODEL}|{system_prompt}|{text}",
+                lambda: request_translation(text)
+            ).decode("utf-8")
         except Exception as e:
             translation = f"[Translation error: {e}]"
             st.warning(t("translation_failed", text))
@@ -329,9 +431,65 @@ def translate_text(texts, source_lang, target_lang):
     status_text.empty()
     return translated
 
-def generate_audio(sentences, output_path, pause_ms, native_speed, foreign_speed, native_code, foreign_code):
-    """Generate combined MP3 from language pairs."""
-    final_audio = AudioSegment.silent(0)
+def synthesize_clip(text, lang, speed):
+    """
+    Returns a trimmed, loudness-normalized and sped-up gTTS clip.
+    Processed clips are kept in the shared cache so any session or
+    replica generating the same phrase and speed skips both the gTTS
+    request and the analysis.
+    """
+    def create():
+        # Unique temp file so concurrent sessions never share a path
+        fd, path = tempfile.mkstemp(prefix="superlearning_clip_", suffix=".mp3")
+        os.close(fd)
+        try:
+            gTTS(text=text, lang=lang).save(path)
+            if not wait_for_file(path, timeout=5):
+                st.warning(f"⚠️ Timeout: {path} was not created in time.")
+                return None
+            audio = trim_and_normalize(AudioSegment.from_mp3(path))
+        finally:
+            os.remove(path)
+        if audio.duration_seconds > 0.3 and speed != 1:
+            audio = audio.speedup(playback_speed=speed)
+        return audio_to_wav_bytes(audio)
+
+    # Keyed on the processing settings so changing them does not serve stale clips
+    clip = shared_cache.get_or_create("clips", f"{CLIP_SETTINGS}|{lang}|{speed}|{text}", create)
+    return wav_bytes_to_audio(clip) if clip is not None else None
+
+def deliver_segments(pending, segments, on_segment, block=False):
+    """
+    Collects encoded segments in deck order and reports each one.
+    Only leading finished futures are taken unless block is set, so
+    segments are never delivered out of order.
+    """
+    while pending and (block or pending[0].done()):
+        segment_bytes = pending.pop(0).result()
+        segments.append(segment_bytes)
+        if on_segment:
+            on_segment(len(segments), segment_bytes)
+
+def generate_audio(sentences, output_path, pause_ms, native_speed, foreign_speed, native_code, foreign_code, encoding=None, on_segment=None):
+    """
+    Generate combined audio file from language pairs.
+    The deck is encoded in segments (following segment_schedule, with
+    encoding settings passed to encode_segment) on the shared encoder
+    pool while later pairs are still rendering, and
+    on_segment(index, segment_bytes) is called for each so playback can
+    start before the whole deck is done. Segments are then joined
+    losslessly into output_path.
+    Returns False if any pair was left out because its audio failed.
+    """
+    encoding = encoding or {}
+    output_format = encoding.get("output_format", "mp3")
+    pending = []
+    segments = []
+    segment_audio = AudioSegment.silent(0)
+    schedule = segment_schedule()
+    segment_target_ms = next(schedule)
+    executor = get_encode_executor()
+    complete = True
 
     progress_bar = st.progress(0)
     status_text = st.empty()
@@ -340,54 +498,65 @@ def generate_audio(sentences, output_path, pause_ms, native_speed, foreign_speed
     if foreign_code == "gb": 
         foreign_code = "en"
 
-    for i, (native_text, foreign_text) in enumerate(sentences, 1):
-        foreign_text = foreign_text.encode("utf-8", "ignore").decode("utf-8").strip()
-        native_text = native_text.encode("utf-8", "ignore").decode("utf-8").strip()
-        foreign_text = foreign_text.replace("¿", "").replace("¡", "")
+    try:
+        for i, (native_text, foreign_text) in enumerate(sentences, 1):
+            foreign_text = foreign_text.encode("utf-8", "ignore").decode("utf-8").strip()
+            native_text = native_text.encode("utf-8", "ignore").decode("utf-8").strip()
+            foreign_text = foreign_text.replace("¿", "").replace("¡", "")
 
-        if not foreign_text:
-            continue
-
-        status_text.text(t("generating_progress", i, len(sentences), foreign_text[:50]))
+            if not foreign_text:
+                continue
 
-        try:
-            native_tts = gTTS(text=native_text, lang=native_code)
-            native_path = os.path.join(tempfile.gettempdir(), f"native_{i}.mp3")
-            native_tts.save(native_path)
-            if not wait_for_file(native_path, timeout=5):
-                st.warning(f"⚠️ Timeout: {native_path} was not created in time.")
+            status_text.text(t("generating_progress", i, len(sentences), foreign_text[:50]))
+
+            # Checked before every gTTS round-trip so finished segments are not held back by it
+            deliver_segments(pending, segments, on_segment)
+            try:
+                native_audio = synthesize_clip(native_text, native_code, native_speed)
+                if native_audio is None:
+                    complete = False
+                    continue
+            except Exception as e:
+                st.warning(f"❗ Native audio failed for '{native_text[:50]}': {e}")
+                complete = False
                 continue
-            native_audio = AudioSegment.from_mp3(native_path)
-            if native_audio.duration_seconds > 0.3 and native_speed != 1:
-                native_audio = native_audio.speedup(playback_speed=native_speed)
-        except Exception as e:
-            st.warning(f"❗ Native audio failed for '{native_text[:50]}': {e}")
-            continue
 
-        try:
-            foreign_tts = gTTS(text=foreign_text, lang=foreign_code)
-            foreign_path = os.path.join(tempfile.gettempdir(), f"foreign_{i}.mp3")
-            foreign_tts.save(foreign_path)
-            if not wait_for_file(foreign_path, timeout=5):
-                st.warning(f"⚠️ Timeout: {foreign_path} was not created in time.")
+            deliver_segments(pending, segments, on_segment)
+            try:
+                foreign_audio = synthesize_clip(foreign_text, foreign_code, foreign_speed)
+                if foreign_audio is None:
+                    complete = False
+                    continue
+            except Exception as e:
+                st.warning(f"❗ Foreign audio failed for '{foreign_text[:50]}': {e}")
+                complete = False
                 continue
-            foreign_audio = AudioSegment.from_mp3(foreign_path)
-            if foreign_audio.duration_seconds > 0.3 and foreign_speed != 1:
-                foreign_audio = foreign_audio.speedup(playback_speed=foreign_speed)
-        except Exception as e:
-            st.warning(f"❗ Foreign audio failed for '{foreign_text[:50]}': {e}")
-            continue
 
-        final_audio += native_audio + foreign_audio + AudioSegment.silent(pause_ms)
+            # Segments always end on a pause, so encoder padding at the joins is inaudible
+            segment_audio += native_audio + foreign_audio + AudioSegment.silent(pause_ms)
 
-        progress_bar.progress(i / len(sentences))
+            if len(segment_audio) >= segment_target_ms:
+                pending.append(executor.submit(encode_segment, segment_audio, **encoding))
+                segment_audio = AudioSegment.silent(0)
+                segment_target_ms = next(schedule)
+                if not segments and len(pending) == 1:
+                    wait(pending, timeout=FIRST_SEGMENT_WAIT_S)
 
-        os.remove(native_path)
-        os.remove(foreign_path)
+            deliver_segments(pending, segments, on_segment)
+            progress_bar.progress(i / len(sentences))
 
-    progress_bar.empty()
-    status_text.empty()
-    final_audio.export(output_path, format="mp3")
+        if len(segment_audio) > 0:
+            pending.append(executor.submit(encode_segment, segment_audio, **encoding))
+        deliver_segments(pending, segments, on_segment, block=True)
+    finally:
+        # Segments of an abandoned deck should not occupy the shared pool
+        for future in pending:
+            future.cancel()
+        progress_bar.empty()
+        status_text.empty()
+
+    join_segments(segments, output_path, output_format)
+    return complete
 
 def wait_for_file(path: str, timeout: float = 5.0, interval: float = 0.05) -> bool:
     """
@@ -527,6 +696,10 @@ if uploaded_file:
                 del st.session_state['generated_audio']
             if 'audio_filename' in st.session_state:
                 del st.session_state['audio_filename']
+            if 'audio_format' in st.session_state:
+                del st.session_state['audio_format']
+            if 'audio_segments' in st.session_state:
+                del st.session_state['audio_segments']
     else:
         # SAME FILE: Just show success message, use cached data
         if 'current_sentences' in st.session_state:
@@ -578,28 +751,89 @@ if uploaded_file:
                 use_container_width=True
             )
         
+        # Segments are shown as separate players while the deck renders. They are
+        # kept in session state and redrawn at the same place on later reruns
+        # (e.g. after a download or a sidebar change) until a new deck is started.
+        segments_container = st.container()
+        
+        def show_segment(index, segment_bytes, segment_format):
+            with segments_container:
+                st.caption(t("segment_ready", index))
+                st.audio(segment_bytes, format=OUTPUT_FORMATS[segment_format]["mime"])
+        
+        if not generate_clicked:
+            for index, segment_bytes in enumerate(st.session_state.get('audio_segments', []), 1):
+                show_segment(index, segment_bytes, st.session_state.audio_segments_format)
+        
         # Generate audio when button is clicked
         if generate_clicked:
+            st.session_state.audio_segments = []
+            st.session_state.audio_segments_format = output_format
+
+            def collect_segment(index, segment_bytes):
+                st.session_state.audio_segments.append(segment_bytes)
+                show_segment(index, segment_bytes, output_format)
+
             with st.spinner(t("generating")):
-                output_path = os.path.join(tempfile.gettempdir(), "superlearning_audio.mp3")
+                output_extension = OUTPUT_FORMATS[output_format]["extension"]
+                encoding = {
+                    "output_format": output_format,
+                    "bitrate": bitrate,
+                    "sample_rate": sample_rate,
+                    "channels": CHANNEL_LAYOUTS[channel_layout]
+                }
+                # Same phrases and settings produce the same deck on any replica
+                deck_key = json.dumps([
+                    sentences_to_use,
+                    pause_duration,
+                    native_speedup,
+                    foreign_speedup,
+                    NATIVE_LANGUAGES[native_lang]["code"],
+                    FOREIGN_LANGUAGES[foreign_lang_code]["code"],
+                    encoding,
+                    CLIP_SETTINGS
+                ], ensure_ascii=False)
                 
                 try:
-                    generate_audio(
-                        sentences_to_use, 
-                        output_path, 
-                        pause_duration, 
-                        native_speedup,
-                        foreign_speedup,
-                        NATIVE_LANGUAGES[native_lang]["code"],
-                        FOREIGN_LANGUAGES[foreign_lang_code]["code"]
-                    )
-                    
-                    with open(output_path, "rb") as audio_file:
-                        audio_bytes = audio_file.read()
+                    audio_bytes = shared_cache.get("decks", deck_key)
+                    if audio_bytes is None:
+                        # Deck renders take minutes, so a busy lock is not waited on: the
+                        # deck is polled for a while, then rendered here as well
+                        with shared_cache.lock("decks", deck_key, blocking=False) as acquired:
+                            if acquired:
+                                audio_bytes = shared_cache.get("decks", deck_key)
+                            else:
+                                notice = st.empty()
+                                notice.info(t("deck_rendering_elsewhere"))
+                                audio_bytes = shared_cache.wait_for("decks", deck_key, DECK_WAIT_S)
+                                notice.empty()
+                            if audio_bytes is None:
+                                fd, output_path = tempfile.mkstemp(prefix="superlearning_audio_", suffix=f".{output_extension}")
+                                os.close(fd)
+                                try:
+                                    complete = generate_audio(
+                                        sentences_to_use, 
+                                        output_path, 
+                                        pause_duration, 
+                                        native_speedup,
+                                        foreign_speedup,
+                                        NATIVE_LANGUAGES[native_lang]["code"],
+                                        FOREIGN_LANGUAGES[foreign_lang_code]["code"],
+                                        encoding=encoding,
+                                        on_segment=collect_segment
+                                    )
+                                    with open(output_path, "rb") as audio_file:
+                                        audio_bytes = audio_file.read()
+                                finally:
+                                    os.remove(output_path)
+                                # Decks with missing pairs are not cached so a later run can fill them in
+                                if complete:
+                                    shared_cache.set("decks", deck_key, audio_bytes)
                     
                     # Store audio in session state
                     st.session_state.generated_audio = audio_bytes
-                    st.session_state.audio_filename = f"superlearning_{NATIVE_LANGUAGES[native_lang]['code']}_{FOREIGN_LANGUAGES[foreign_lang_code]['code']}_{len(sentences_to_use)}_phrases.mp3"
+                    st.session_state.audio_filename = f"superlearning_{NATIVE_LANGUAGES[native_lang]['code']}_{FOREIGN_LANGUAGES[foreign_lang_code]['code']}_{len(sentences_to_use)}_phrases.{output_extension}"
+                    st.session_state.audio_format = output_format
                     st.success(t("success"))
                     
                 except Exception as e:
@@ -607,13 +841,14 @@ if uploaded_file:
         
         # Display audio player and download button if audio has been generated
         if 'generated_audio' in st.session_state and st.session_state.generated_audio:
-            st.audio(st.session_state.generated_audio, format="audio/mp3")
+            generated_format = st.session_state.get('audio_format', 'mp3')
+            st.audio(st.session_state.generated_audio, format=OUTPUT_FORMATS[generated_format]["mime"])
             
             st.download_button(
-                label=t("download_button"),
+                label=t("download_button", generated_format.upper()),
                 data=st.session_state.generated_audio,
                 file_name=st.session_state.get('audio_filename', 'superlearning_audio.mp3'),
-                mime="audio/mp3",
+                mime=OUTPUT_FORMATS[generated_format]["mime"],
                 use_container_width=True
             )
 
@@ -0,0 +1,225 @@
+import io
+import os
+import tempfile
+
+import ffmpeg
+import numpy as np
+
+from pydub import AudioSegment
+
+# Per-clip analysis settings for gTTS output
+ANALYSIS_WINDOW_MS = 10
+SILENCE_THRESHOLD_DBFS = -45.0
+EDGE_PADDING_MS = 40
+TARGET_DBFS = -20.0
+
+# Identifies how clips were processed; bump CLIP_PROCESSING_VERSION when
+# trim_and_normalize changes so clips cached under old settings are not reused
+CLIP_PROCESSING_VERSION = 1
+CLIP_SETTINGS = (
+    f"v{CLIP_PROCESSING_VERSION}|{ANALYSIS_WINDOW_MS}|{SILENCE_THRESHOLD_DBFS}"
+    f"|{EDGE_PADDING_MS}|{TARGET_DBFS}"
+)
+
+INT16_MAX = 32767
+
+# Output formats for the generated deck. Segments of "appendable" formats
+# are bare frame streams (MP3 without ID3 tag or Xing header, ADTS AAC)
+# and can be joined byte for byte; the others are joined with ffmpeg's
+# concat demuxer using stream copy, so no format is ever re-encoded.
+# "sample_rates" maps each sample rate the encoder supports to the
+# bitrates it can honor at that rate (MP3 below 32 kHz is MPEG-2 and
+# tops out at 160k, libopus only runs at 8/12/16/24/48 kHz).
+OUTPUT_FORMATS = {
+    "mp3": {
+        "format": "mp3",
+        "codec": "libmp3lame",
+        "parameters": ["-write_xing", "0", "-id3v2_version", "0"],
+        "extension": "mp3",
+        "mime": "audio/mp3",
+        "appendable": True,
+        "sample_rates": {
+            16000: ["24k", "32k", "48k", "64k", "96k", "128k", "160k"],
+            24000: ["24k", "32k", "48k", "64k", "96k", "128k", "160k"],
+            44100: ["32k", "48k", "64k", "96k", "128k", "160k", "192k"],
+            48000: ["32k", "48k", "64k", "96k", "128k", "160k", "192k"]
+        },
+        "default_bitrate": "128k"
+    },
+    "aac": {
+        "format": "adts",
+        "codec": "aac",
+        "parameters": [],
+        "extension": "aac",
+        "mime": "audio/aac",
+        "appendable": True,
+        "sample_rates": {
+            16000: ["24k", "32k", "48k", "64k"],
+            24000: ["24k", "32k", "48k", "64k", "96k"],
+            44100: ["32k", "48k", "64k", "96k", "128k", "192k"],
+            48000: ["32k", "48k", "64k", "96k", "128k", "192k"]
+        },
+        "default_bitrate": "64k"
+    },
+    "opus": {
+        "format": "ogg",
+        "codec": "libopus",
+        "parameters": ["-application", "voip"],
+        "extension": "ogg",
+        "mime": "audio/ogg",
+        "appendable": False,
+        "sample_rates": {
+            16000: ["16k", "24k", "32k", "48k", "64k"],
+            24000: ["16k", "24k", "32k", "48k", "64k", "96k"],
+            48000: ["16k", "24k", "32k", "48k", "64k", "96k", "128k"]
+        },
+        "default_bitrate": "32k"
+    }
+}
+
+# Progressive playback: the first deck segment is short to get audio to the
+# user quickly, then each segment is twice as long as the previous one so it
+# finishes rendering while the previous one is still playing
+FIRST_SEGMENT_MS = 20_000
+MAX_SEGMENT_MS = 320_000
+
+# gTTS clips are 24 kHz, so this rate avoids resampling
+DEFAULT_SAMPLE_RATE = 24000
+CHANNEL_LAYOUTS = {"mono": 1, "stereo": 2}
+
+
+def audio_to_array(audio):
+    """Return an AudioSegment as an int16 array shaped (frames, channels)."""
+    if audio.sample_width != 2:
+        audio = audio.set_sample_width(2)
+    samples = np.frombuffer(audio.raw_data, dtype=np.int16)
+    return samples.reshape(-1, audio.channels)
+
+
+def array_to_audio(samples, template):
+    """Build an AudioSegment from an int16 array using template's format."""
+    return AudioSegment(
+        data=np.ascontiguousarray(samples, dtype=np.int16).tobytes(),
+        sample_width=2,
+        frame_rate=template.frame_rate,
+        channels=template.channels,
+    )
+
+
+def audio_to_wav_bytes(audio):
+    """Serialize an AudioSegment losslessly as WAV bytes (no ffmpeg needed)."""
+    buffer = io.BytesIO()
+    audio.export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+def wav_bytes_to_audio(data):
+    """Load an AudioSegment from bytes written by audio_to_wav_bytes."""
+    return AudioSegment.from_wav(io.BytesIO(data))
+
+
+def trim_and_normalize(audio,
+                       silence_thresh=SILENCE_THRESHOLD_DBFS,
+                       target_dbfs=TARGET_DBFS,
+                       window_ms=ANALYSIS_WINDOW_MS,
+                       padding_ms=EDGE_PADDING_MS):
+    """
+    Trims leading/trailing silence and normalizes loudness of a TTS clip.
+    Both steps use the same windowed RMS analysis of the int16 samples,
+    so the clip is scanned once instead of per millisecond as in
+    pydub.silence. Returns the clip unchanged if it is entirely silent.
+    """
+    samples = audio_to_array(audio)
+
+    window = max(1, int(audio.frame_rate * window_ms / 1000))
+    n_windows = len(samples) // window
+    if n_windows == 0:
+        return audio
+
+    # Mean square energy per window across all channels
+    windows = samples[:n_windows * window].astype(np.float64).reshape(n_windows, -1)
+    energy = np.mean(windows ** 2, axis=1)
+    with np.errstate(divide="ignore"):
+        window_dbfs = 10 * np.log10(energy / (INT16_MAX ** 2))
+
+    voiced = np.flatnonzero(window_dbfs > silence_thresh)
+    if voiced.size == 0:
+        return audio
+
+    padding = int(audio.frame_rate * padding_ms / 1000)
+    start = max(0, voiced[0] * window - padding)
+    end = min(len(samples), (voiced[-1] + 1) * window + padding)
+    trimmed = samples[start:end]
+
+    # Loudness is measured over voiced windows only so pauses inside
+    # the phrase do not pull the level down
+    voiced_dbfs = 10 * np.log10(np.mean(energy[voiced]) / (INT16_MAX ** 2))
+    gain = 10 ** ((target_dbfs - voiced_dbfs) / 20)
+    peak = int(np.max(np.abs(trimmed.astype(np.int32))))
+    if peak > 0:
+        gain = min(gain, INT16_MAX / peak)
+
+    normalized = np.clip(np.rint(trimmed * gain), -INT16_MAX - 1, INT16_MAX)
+    return array_to_audio(normalized.astype(np.int16), audio)
+
+
+def segment_schedule():
+    """Yields target deck segment lengths in ms: 20 s, 40 s, 80 s, ... capped at MAX_SEGMENT_MS."""
+    length = FIRST_SEGMENT_MS
+    while True:
+        yield length
+        length = min(length * 2, MAX_SEGMENT_MS)
+
+
+def encode_segment(audio, output_format="mp3", bitrate="128k", sample_rate=DEFAULT_SAMPLE_RATE, channels=None):
+    """
+    Encodes an AudioSegment as a self-contained segment of output_format.
+    Raises ValueError for a sample rate or bitrate the format does not
+    support. Safe to call from worker threads, the encoding runs in an
+    ffmpeg subprocess.
+    """
+    spec = OUTPUT_FORMATS[output_format]
+    if sample_rate not in spec["sample_rates"]:
+        raise ValueError(f"{output_format} does not support {sample_rate} Hz")
+    if bitrate not in spec["sample_rates"][sample_rate]:
+        raise ValueError(f"{output_format} at {sample_rate} Hz does not support {bitrate}")
+    audio = audio.set_frame_rate(sample_rate)
+    if channels:
+        audio = audio.set_channels(channels)
+
+    buffer = io.BytesIO()
+    audio.export(
+        buffer,
+        format=spec["format"],
+        codec=spec["codec"],
+        bitrate=bitrate,
+        parameters=spec["parameters"]
+    )
+    return buffer.getvalue()
+
+
+def join_segments(segments, output_path, output_format="mp3"):
+    """Losslessly joins encoded segments (in order) into output_path."""
+    if OUTPUT_FORMATS[output_format]["appendable"]:
+        with open(output_path, "wb") as f:
+            for segment_bytes in segments:
+                f.write(segment_bytes)
+        return
+
+    extension = OUTPUT_FORMATS[output_format]["extension"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        list_path = os.path.join(tmp_dir, "segments.txt")
+        with open(list_path, "w") as list_file:
+            for i, segment_bytes in enumerate(segments):
+                segment_path = os.path.join(tmp_dir, f"segment_{i}.{extension}")
+                with open(segment_path, "wb") as f:
+                    f.write(segment_bytes)
+                list_file.write(f"file '{segment_path}'\n")
+
+        (
+            ffmpeg
+            .input(list_path, format="concat", safe=0)
+            .output(output_path, c="copy", format=OUTPUT_FORMATS[output_format]["format"])
+            .overwrite_output()
+            .run(quiet=True)
+        )
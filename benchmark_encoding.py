@@ -0,0 +1,113 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_processing import (
+    OUTPUT_FORMATS,
+    array_to_audio,
+    encode_segment,
+    join_segments,
+    segment_schedule
+)
+from pydub import AudioSegment
+
+# (output_format, bitrate, sample_rate, channels); each must be allowed by
+# OUTPUT_FORMATS or encode_segment raises
+OPTIONS = [
+    ("mp3", "128k", 24000, 1),
+    ("mp3", "64k", 24000, 1),
+    ("mp3", "128k", 44100, 2),
+    ("aac", "64k", 24000, 1),
+    ("aac", "48k", 24000, 1),
+    ("opus", "32k", 24000, 1),
+    ("opus", "24k", 16000, 1),
+]
+
+
+def synthetic_deck(minutes, frame_rate=24000):
+    """
+    Builds a deck-like AudioSegment without network access: two ~1.5 s
+    voiced bursts (stand-ins for the native and foreign clips) followed
+    by a 5 s pause, repeated.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(frame_rate * 1.5)) / frame_rate
+    envelope = np.sin(np.pi * t / t[-1])
+    pause = AudioSegment.silent(5000, frame_rate=frame_rate)
+
+    deck = AudioSegment.silent(0, frame_rate=frame_rate)
+    template = AudioSegment.silent(0, frame_rate=frame_rate)
+    while len(deck) < minutes * 60_000:
+        for pitch in rng.uniform(120, 260, size=2):
+            burst = 0.3 * envelope * np.sin(2 * np.pi * pitch * t) + 0.02 * rng.standard_normal(t.size)
+            deck += array_to_audio((burst * 32767).astype(np.int16), template)
+        deck += pause
+    return deck
+
+
+def split_deck(deck):
+    """Splits a rendered deck into chunks following the app's segment_schedule."""
+    chunks = []
+    start = 0
+    for length in segment_schedule():
+        if start >= len(deck):
+            return chunks
+        chunks.append(deck[start:start + length])
+        start += length
+
+
+def encode_deck(deck, workers, output_format, bitrate, sample_rate, channels):
+    """
+    Encodes an already rendered deck in segment_schedule chunks on a
+    thread pool and joins them. The app overlaps encoding with rendering
+    instead, so the parallel column is an upper bound for a deck whose
+    pairs are all cached.
+    """
+    chunks = split_deck(deck)
+    encoding = {
+        "output_format": output_format,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels
+    }
+
+    extension = OUTPUT_FORMATS[output_format]["extension"]
+    fd, output_path = tempfile.mkstemp(prefix="benchmark_deck_", suffix=f".{extension}")
+    os.close(fd)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        segments = list(executor.map(lambda chunk: encode_segment(chunk, **encoding), chunks))
+    join_segments(segments, output_path, output_format)
+    elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark deck encoding options")
+    parser.add_argument("--minutes", type=float, default=10, help="Length of the synthetic deck")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Parallel encoders")
+    args = parser.parse_args()
+
+    deck = synthetic_deck(args.minutes)
+    chunk_lengths = ", ".join(f"{len(chunk) / 1000:.0f}" for chunk in split_deck(deck))
+    print(f"Synthetic deck: {len(deck) / 1000:.0f} s, {args.workers} workers, chunks of {chunk_lengths} s\n")
+    print(f"{'option':<28}{'serial s':>10}{'parallel s':>12}{'x realtime':>12}{'size KiB':>10}")
+
+    for output_format, bitrate, sample_rate, channels in OPTIONS:
+        serial, _ = encode_deck(deck, 1, output_format, bitrate, sample_rate, channels)
+        parallel, size = encode_deck(deck, args.workers, output_format, bitrate, sample_rate, channels)
+        label = f"{output_format} {bitrate} {sample_rate} Hz {'mono' if channels == 1 else 'stereo'}"
+        realtime = len(deck) / 1000 / parallel
+        print(f"{label:<28}{serial:>10.2f}{parallel:>12.2f}{realtime:>12.0f}{size / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, writes are still atomic
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "superlearning_cache")
+DEFAULT_MAX_MB = 2048
+DEFAULT_MAX_AGE_DAYS = 30
+
+LOCK_DIR = "locks"
+
+# Sweeps run at most every SWEEP_INTERVAL seconds across all processes
+# sharing the cache, tracked by the mtime of SWEEP_MARKER in the root
+SWEEP_INTERVAL = 300
+SWEEP_MARKER = "last_sweep"
+# Unfinished writes and unused lock files older than this are removed
+STALE_TMP_AGE = 3600
+
+POLL_INTERVAL = 0.5
+
+
+class SharedCache:
+    """
+    Byte cache shared by every process and replica that mounts the same
+    directory (a shared volume in production, a local directory as a
+    stand-in). Entries live in one subdirectory per namespace under the
+    SHA-256 of their key.
+
+    Writes go to a temporary file that is atomically renamed into place,
+    so readers never see partial entries and need no lock. Creation of
+    a missing entry takes an exclusive per-key file lock, so concurrent
+    requests for the same entry do the work once and the others wait
+    for its result. Lock files are removed when released.
+
+    Entries older than max_age seconds are evicted, and once the cache
+    exceeds max_bytes the least recently used entries go first (reads
+    refresh an entry's mtime). After a write, a sweep runs if no process
+    sharing the cache has swept in the last SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, root=None, max_bytes=None, max_age=None):
+        self.root = root or os.getenv("SHARED_CACHE_DIR") or DEFAULT_CACHE_DIR
+        if max_bytes is None:
+            max_bytes = int(os.getenv("SHARED_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        if max_age is None:
+            max_age = float(os.getenv("SHARED_CACHE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS)) * 86400
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _digest(self, key):
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _path(self, namespace, key):
+        directory = os.path.join(self.root, namespace)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, self._digest(key))
+
+    def get(self, namespace, key):
+        """Returns cached bytes, or None if the entry does not exist."""
+        path = self._path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def set(self, namespace, key, value):
+        """Stores bytes under key, replacing any existing entry atomically."""
+        path = self._path(namespace, key)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self.maybe_sweep()
+
+    def wait_for(self, namespace, key, timeout):
+        """Polls for an entry another process is creating; None on timeout."""
+        deadline = time.time() + timeout
+        while True:
+            value = self.get(namespace, key)
+            if value is not None or time.time() >= deadline:
+                return value
+            time.sleep(POLL_INTERVAL)
+
+    @contextmanager
+    def _locked(self, lock_path, blocking=True):
+        """
+        Yields True while holding an exclusive lock on lock_path, or False
+        if blocking is off and the lock is busy. The lock file is removed
+        before release; a waiter that ends up locking a removed file
+        notices the inode changed and retries on the new one.
+        """
+        if not fcntl:
+            yield True
+            return
+
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock_file.close()
+                yield False
+                return
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+        try:
+            yield True
+        finally:
+            os.remove(lock_path)
+            lock_file.close()
+
+    @contextmanager
+    def lock(self, namespace, key, blocking=True):
+        """
+        Holds an exclusive lock on key across processes sharing the cache.
+        Yields whether the lock was acquired, which is always True when
+        blocking.
+        """
+        lock_path = os.path.join(self.root, namespace, LOCK_DIR, f"{self._digest(key)}.lock")
+        with self._locked(lock_path, blocking) as acquired:
+            yield acquired
+
+    def get_or_create(self, namespace, key, create):
+        """
+        Returns the cached entry for key, calling create() to build it if
+        missing. create() returns bytes, or None for results that must
+        not be cached (e.g. failed requests).
+        """
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+
+        with self.lock(namespace, key):
+            # Another process may have created it while we waited
+            value = self.get(namespace, key)
+            if value is not None:
+                return value
+            value = create()
+            if value is not None:
+                self.set(namespace, key, value)
+            return value
+
+    def _sweep_due(self):
+        try:
+            return time.time() - os.stat(os.path.join(self.root, SWEEP_MARKER)).st_mtime >= SWEEP_INTERVAL
+        except FileNotFoundError:
+            return True
+
+    def maybe_sweep(self):
+        """
+        Sweeps unless a process sharing the cache did so within the last
+        SWEEP_INTERVAL seconds. Returns True if this call swept.
+        """
+        if not self._sweep_due():
+            return False
+        return self.sweep(only_if_due=True)
+
+    def sweep(self, only_if_due=False):
+        """
+        Evicts expired entries, then least recently used ones until the
+        cache fits in max_bytes, and removes abandoned temporary and lock
+        files. Skipped if another process is already sweeping (or, with
+        only_if_due, has just swept); returns True if this call swept.
+        """
+        # Kept in the root, which holds no entries, so the sweep never scans it
+        with self._locked(os.path.join(self.root, "sweep.lock"), blocking=False) as acquired:
+            if not acquired or (only_if_due and not self._sweep_due()):
+                return False
+
+            marker = os.path.join(self.root, SWEEP_MARKER)
+            with open(marker, "a"):
+                pass
+            os.utime(marker)
+
+            now = time.time()
+            entries = []
+            for namespace in os.scandir(self.root):
+                if not namespace.is_dir():
+                    continue
+                for entry in os.scandir(namespace.path):
+                    if not entry.is_file():
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    if entry.name.endswith(".tmp"):
+                        if now - stat.st_mtime > STALE_TMP_AGE:
+                            self._remove(entry.path)
+                    elif now - stat.st_mtime > self.max_age:
+                        self._remove(entry.path)
+                    else:
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+                # Lock files left by crashed processes; removed only if idle
+                lock_dir = os.path.join(namespace.path, LOCK_DIR)
+                if os.path.isdir(lock_dir):
+                    for lock in os.scandir(lock_dir):
+                        try:
+                            stale = now - lock.stat().st_mtime > STALE_TMP_AGE
+                        except FileNotFoundError:
+                            continue
+                        if stale:
+                            with self._locked(lock.path, blocking=False):
+                                pass
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+            return True
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,95 @@
+from itertools import islice
+
+import numpy as np
+
+from audio_processing import (
+    EDGE_PADDING_MS,
+    INT16_MAX,
+    TARGET_DBFS,
+    array_to_audio,
+    audio_to_array,
+    segment_schedule,
+    trim_and_normalize
+)
+from pydub import AudioSegment
+
+FRAME_RATE = 24000
+PADDING = FRAME_RATE * EDGE_PADDING_MS // 1000
+
+
+def _audio(samples, channels=1):
+    template = AudioSegment.silent(0, frame_rate=FRAME_RATE).set_channels(channels)
+    return array_to_audio(np.asarray(samples).reshape(-1, channels), template)
+
+
+def _tone(seconds, amplitude):
+    t = np.arange(int(FRAME_RATE * seconds)) / FRAME_RATE
+    return (amplitude * INT16_MAX * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def _silence(seconds):
+    return np.zeros(int(FRAME_RATE * seconds), dtype=np.int16)
+
+
+def _dbfs(samples):
+    rms = np.sqrt(np.mean(samples.astype(np.float64) ** 2))
+    return 20 * np.log10(rms / INT16_MAX)
+
+
+def test_trims_edge_silence_keeping_padding():
+    tone = _tone(0.5, 0.1)
+    clip = _audio(np.concatenate([_silence(0.5), tone, _silence(1.0)]))
+
+    samples = audio_to_array(trim_and_normalize(clip))
+
+    assert len(samples) == len(tone) + 2 * PADDING
+    assert not samples[:PADDING].any()
+    assert not samples[-PADDING:].any()
+
+
+def test_normalizes_voiced_part_to_target_dbfs():
+    clip = _audio(np.concatenate([_silence(0.2), _tone(0.5, 0.05), _silence(0.2)]))
+
+    samples = audio_to_array(trim_and_normalize(clip))
+
+    assert abs(_dbfs(samples[PADDING:-PADDING]) - TARGET_DBFS) < 0.1
+
+
+def test_peak_limiter_prevents_clipping():
+    # Quiet speech with one loud click: full gain would clip the click
+    samples = _tone(0.5, 0.02)
+    samples[6000] = int(0.9 * INT16_MAX)
+    clip = _audio(samples)
+
+    result = audio_to_array(trim_and_normalize(clip))
+
+    assert int(np.max(np.abs(result.astype(np.int32)))) == INT16_MAX
+    assert _dbfs(result) < TARGET_DBFS
+
+
+def test_silent_and_short_clips_are_returned_unchanged():
+    silent = _audio(_silence(0.5))
+    short = _audio(_tone(0.005, 0.5))
+
+    assert trim_and_normalize(silent) is silent
+    assert trim_and_normalize(short) is short
+
+
+def test_stereo_keeps_channels_and_trims_both():
+    tone = _tone(0.5, 0.1)
+    left = np.concatenate([_silence(0.5), tone, _silence(0.5)])
+    right = np.concatenate([_silence(0.5), tone // 2, _silence(0.5)])
+    clip = _audio(np.column_stack([left, right]), channels=2)
+
+    result = trim_and_normalize(clip)
+    samples = audio_to_array(result)
+
+    assert result.channels == 2
+    assert samples.shape == (len(tone) + 2 * PADDING, 2)
+    assert np.abs(samples[:, 0]).max() > np.abs(samples[:, 1]).max()
+
+
+def test_segment_schedule_doubles_up_to_cap():
+    assert list(islice(segment_schedule(), 7)) == [
+        20_000, 40_000, 80_000, 160_000, 320_000, 320_000, 320_000
+    ]
@@ -0,0 +1,96 @@
+import os
+import time
+from multiprocessing import Pool
+
+from shared_cache import SharedCache
+
+
+def _create_once(args):
+    root, calls_path = args
+
+    def create():
+        with open(calls_path, "a") as f:
+            f.write("x")
+        # Keep the lock long enough for the other processes to queue on it
+        time.sleep(0.2)
+        return b"value"
+
+    return SharedCache(root).get_or_create("clips", "same key", create)
+
+
+def test_get_or_create_creates_once_across_processes(tmp_path):
+    calls_path = tmp_path / "calls"
+    calls_path.write_text("")
+    root = str(tmp_path / "cache")
+
+    with Pool(8) as pool:
+        results = pool.map(_create_once, [(root, str(calls_path))] * 16)
+
+    assert set(results) == {b"value"}
+    assert calls_path.read_text() == "x"
+
+
+def test_get_or_create_does_not_cache_none(tmp_path):
+    cache = SharedCache(str(tmp_path))
+    calls = []
+
+    def create():
+        calls.append(1)
+        return None
+
+    assert cache.get_or_create("translations", "key", create) is None
+    assert cache.get_or_create("translations", "key", create) is None
+    assert len(calls) == 2
+    assert cache.get("translations", "key") is None
+
+
+def test_sweep_evicts_least_recently_used_and_expired(tmp_path):
+    cache = SharedCache(str(tmp_path), max_bytes=250, max_age=3600)
+    for i, key in enumerate(["old", "middle", "new"]):
+        cache.set("decks", key, b"x" * 100)
+        os.utime(cache._path("decks", key), (1000 + i, time.time() - 100 + i))
+    cache.set("decks", "expired", b"x")
+    os.utime(cache._path("decks", "expired"), (0, time.time() - 7200))
+
+    cache.sweep()
+
+    assert cache.get("decks", "expired") is None
+    assert cache.get("decks", "old") is None
+    assert cache.get("decks", "middle") is not None
+    assert cache.get("decks", "new") is not None
+
+
+def test_sweep_throttle_is_shared_between_instances(tmp_path):
+    first = SharedCache(str(tmp_path))
+    second = SharedCache(str(tmp_path))
+
+    assert first.maybe_sweep() is True
+    assert second.maybe_sweep() is False
+    assert first.maybe_sweep() is False
+
+
+def _try_lock(args):
+    root, key = args
+    with SharedCache(root).lock("decks", key, blocking=False) as acquired:
+        return acquired
+
+
+def test_non_blocking_lock_reports_busy_and_removes_lock_file(tmp_path):
+    cache = SharedCache(str(tmp_path))
+    lock_dir = tmp_path / "decks" / "locks"
+
+    with cache.lock("decks", "deck") as acquired:
+        assert acquired
+        with Pool(1) as pool:
+            assert pool.map(_try_lock, [(str(tmp_path), "deck")]) == [False]
+            assert pool.map(_try_lock, [(str(tmp_path), "other deck")]) == [True]
+
+    assert list(lock_dir.iterdir()) == []
+
+
+def test_wait_for_returns_entry_or_none_on_timeout(tmp_path):
+    cache = SharedCache(str(tmp_path))
+    cache.set("decks", "ready", b"deck")
+
+    assert cache.wait_for("decks", "ready", timeout=0) == b"deck"
+    assert cache.wait_for("decks", "missing", timeout=0) is None